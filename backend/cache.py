@@ -0,0 +1,168 @@
+import json
+import logging
+import os
+import select
+import threading
+
+from sqlalchemy import event, text
+from sqlalchemy import select as sql_select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from database import SessionLocal, engine
+import models
+
+logger = logging.getLogger(__name__)
+
+CHANGE_CHANNEL = "recipe_manager_changes"
+PENDING_CHANGES_KEY = "pending_cache_changes"
+POLL_INTERVAL = float(os.getenv("CACHE_POLL_INTERVAL", "2"))
+
+
+class LocalCache:
+    """
+    Per-process cache. Every entry declares the tables it was built from and is
+    dropped as soon as one of them changes.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._versions = {}
+        # Bumped by clear(), which also covers tables that were never invalidated
+        self._generation = 0
+
+    def get_or_load(self, key, tables, loader):
+        with self._lock:
+            if key in self._entries:
+                return self._entries[key][1]
+            versions = self._current_versions(tables)
+
+        value = loader()
+
+        with self._lock:
+            # Skip storing if a table changed while the value was being loaded
+            if versions == self._current_versions(tables):
+                self._entries[key] = (tuple(tables), value)
+        return value
+
+    def versions(self, tables):
+        """Current version of each table, bumped on every invalidation and by clear()."""
+        with self._lock:
+            return self._current_versions(tables)
+
+    def _current_versions(self, tables):
+        return (self._generation,) + tuple(self._versions.get(table, 0) for table in tables)
+
+    def invalidate(self, table):
+        with self._lock:
+            self._versions[table] = self._versions.get(table, 0) + 1
+            stale_keys = [key for key, (tables, _) in self._entries.items() if table in tables]
+            for key in stale_keys:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+
+
+local_cache = LocalCache()
+
+
+def publish_change(db, table, record_id=None):
+    """
+    Announce a change made in the session's current transaction. Other workers
+    learn about it when the transaction commits, through NOTIFY on Postgres and
+    a cache_versions bump elsewhere. This worker's entries are dropped right
+    after the commit.
+    """
+    db.info.setdefault(PENDING_CHANGES_KEY, set()).add(table)
+    if db.get_bind().dialect.name == "postgresql":
+        payload = json.dumps({"table": table, "id": record_id})
+        db.execute(text("SELECT pg_notify(:channel, :payload)"), {"channel": CHANGE_CHANNEL, "payload": payload})
+    else:
+        versions = models.CacheVersion.__table__
+        db.execute(sqlite_insert(versions).values(table_name=table, version=1).on_conflict_do_update(
+            index_elements=[versions.c.table_name], set_={"version": versions.c.version + 1}
+        ))
+
+
+@event.listens_for(SessionLocal, "after_commit")
+def _invalidate_committed_changes(session):
+    for table in session.info.pop(PENDING_CHANGES_KEY, ()):
+        local_cache.invalidate(table)
+
+
+@event.listens_for(SessionLocal, "after_rollback")
+def _discard_rolled_back_changes(session):
+    session.info.pop(PENDING_CHANGES_KEY, None)
+
+
+def _listen_postgres(stop_event):
+    while not stop_event.is_set():
+        raw_conn = None
+        try:
+            raw_conn = engine.raw_connection()
+            # The listening connection lives for the whole process, keep it out of the pool
+            raw_conn.detach()
+            dbapi_conn = raw_conn.driver_connection
+            dbapi_conn.autocommit = True
+            with dbapi_conn.cursor() as cursor:
+                cursor.execute(f"LISTEN {CHANGE_CHANNEL}")
+            # Notifications sent while we were not listening are lost
+            local_cache.clear()
+
+            while not stop_event.is_set():
+                if select.select([dbapi_conn], [], [], POLL_INTERVAL) == ([], [], []):
+                    continue
+                dbapi_conn.poll()
+                while dbapi_conn.notifies:
+                    notification = dbapi_conn.notifies.pop(0)
+                    local_cache.invalidate(json.loads(notification.payload)["table"])
+        except Exception:
+            logger.exception("Change listener failed, reconnecting")
+            stop_event.wait(POLL_INTERVAL)
+        finally:
+            if raw_conn is not None:
+                raw_conn.close()
+
+
+def _read_versions():
+    with engine.connect() as conn:
+        return dict(conn.execute(sql_select(models.CacheVersion.table_name, models.CacheVersion.version)).all())
+
+
+def _poll_versions(stop_event, last_versions):
+    # Fallback for databases without LISTEN/NOTIFY (SQLite): publish_change bumps
+    # a per-table counter in the writer's transaction.
+    while not stop_event.is_set():
+        stop_event.wait(POLL_INTERVAL)
+        try:
+            versions = _read_versions()
+            if last_versions is None:
+                # No baseline to compare with, so anything may have changed
+                local_cache.clear()
+            else:
+                for table, version in versions.items():
+                    if last_versions.get(table) != version:
+                        local_cache.invalidate(table)
+            last_versions = versions
+        except Exception:
+            logger.exception("Change polling failed")
+
+
+def start_change_listener():
+    """Start the background thread that invalidates this worker's cache. Returns its stop event."""
+    stop_event = threading.Event()
+    if engine.dialect.name == "postgresql":
+        target, args = _listen_postgres, (stop_event,)
+    else:
+        # Baseline taken before returning, so changes made after startup are never missed
+        try:
+            baseline = _read_versions()
+        except Exception:
+            logger.exception("Could not read cache versions")
+            baseline = None
+        target, args = _poll_versions, (stop_event, baseline)
+    threading.Thread(target=target, args=args, name="cache-invalidation", daemon=True).start()
+    return stop_event
@@ -0,0 +1,223 @@
+from collections import defaultdict
+from decimal import Decimal, ROUND_CEILING
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session, aliased
+
+import models
+
+# Same conversions as the frontend cost calculation (ml is treated as g)
+GRAMS_PER_UNIT = {"g": Decimal("1"), "kg": Decimal("1000"), "ml": Decimal("1"), "l": Decimal("1000")}
+EGG_DISPLAY_NAME = "卵"
+DEFAULT_EGG_WEIGHT = Decimal("50")
+EGG_WEIGHT_FIELDS = {
+    "whole_egg": "whole_egg_weight",
+    "egg_white": "egg_white_weight",
+    "egg_yolk": "egg_yolk_weight",
+}
+
+QUANTITY_PRECISION = Decimal("0.001")
+COST_PRECISION = Decimal("0.01")
+
+
+def effective_price(purchase):
+    """Price of one purchase including discount and tax."""
+    discount = purchase.discount_rate or Decimal("0")
+    return purchase.price_excluding_tax * (1 - discount) * (1 + purchase.tax_rate)
+
+
+def _latest_prices(db: Session, model, key_column, ids, as_of=None):
+    if not ids:
+        return {}
+    # Rank purchases per key in SQL so that only the latest one is loaded
+    query = db.query(
+        model,
+        func.row_number().over(
+            partition_by=key_column, order_by=(model.purchase_date.desc(), model.id.desc())
+        ).label("rank"),
+    ).filter(key_column.in_(ids))
+    if as_of is not None:
+        query = query.filter(model.purchase_date <= as_of)
+    ranked = query.subquery()
+    latest = aliased(model, ranked)
+    return {
+        getattr(purchase, key_column.key): effective_price(purchase)
+        for purchase in db.query(latest).filter(ranked.c.rank == 1).all()
+    }
+
+
+def latest_ingredient_prices(db: Session, ingredient_ids, as_of=None):
+    """Latest effective purchase price per ingredient, optionally as of a given date."""
+    return _latest_prices(db, models.PurchaseHistory, models.PurchaseHistory.ingredient_id, ingredient_ids, as_of)
+
+
+def latest_packaging_prices(db: Session, material_ids, as_of=None):
+    """Latest effective purchase price per packaging material, optionally as of a given date."""
+    return _latest_prices(
+        db, models.PackagingPurchaseHistory, models.PackagingPurchaseHistory.packaging_material_id, material_ids, as_of
+    )
+
+
+def usage_in_grams(detail, ingredient, egg_master):
+    """Usage of a recipe detail in grams, converting egg counts with the egg master."""
+    amount = Decimal(detail.usage_amount)
+    if ingredient.recipe_display_name == EGG_DISPLAY_NAME and detail.egg_type and egg_master is not None:
+        return amount * getattr(egg_master, EGG_WEIGHT_FIELDS[detail.egg_type])
+    return amount * GRAMS_PER_UNIT.get(detail.usage_unit, Decimal("1"))
+
+
+def pack_size_in_grams(ingredient):
+    """Size of one purchased pack of the ingredient in grams."""
+    quantity = Decimal(ingredient.quantity)
+    if ingredient.quantity_unit == "個" and ingredient.recipe_display_name == EGG_DISPLAY_NAME:
+        return quantity * DEFAULT_EGG_WEIGHT
+    return quantity * GRAMS_PER_UNIT.get(ingredient.quantity_unit, Decimal("1"))
+
+
+def load_recipe_details(db: Session, recipe_ids):
+    """Recipe details with their ingredients for the given recipes, grouped by recipe_id."""
+    details_by_recipe = defaultdict(list)
+    if not recipe_ids:
+        return details_by_recipe, {}
+    details = db.query(models.RecipeDetail).filter(models.RecipeDetail.recipe_id.in_(recipe_ids)).all()
+    ingredient_ids = {detail.ingredient_id for detail in details}
+    ingredients = {
+        ingredient.ingredient_id: ingredient
+        for ingredient in db.query(models.Ingredient).filter(models.Ingredient.ingredient_id.in_(ingredient_ids)).all()
+    }
+    for detail in details:
+        if detail.ingredient_id in ingredients:
+            details_by_recipe[detail.recipe_id].append(detail)
+    return details_by_recipe, ingredients
+
+
+def recipe_batch_costs(details_by_recipe, ingredients, egg_master, ingredient_prices):
+    """Cost of one batch per recipe. Ingredients without a known price cost nothing."""
+    costs = {}
+    for recipe_id, details in details_by_recipe.items():
+        cost = Decimal("0")
+        for detail in details:
+            ingredient = ingredients[detail.ingredient_id]
+            price = ingredient_prices.get(ingredient.ingredient_id)
+            if price is not None:
+                cost += usage_in_grams(detail, ingredient, egg_master) / pack_size_in_grams(ingredient) * price
+        costs[recipe_id] = cost
+    return costs
+
+
+def package_cost(product, unit_cost, material, packaging_prices):
+    """Cost of one package of the product: its pieces plus one packaging material unit."""
+    cost = unit_cost * product.pieces_per_package
+    if material is not None and material.packaging_material_id in packaging_prices:
+        cost += packaging_prices[material.packaging_material_id] / material.quantity
+    return cost
+
+
+def _ceil(value):
+    return int(value.to_integral_value(rounding=ROUND_CEILING))
+
+
+def explode_production_plan(db: Session, packages_by_product):
+    """
+    Total ingredient and packaging requirements for producing the given number
+    of packages per product. Recipe details describe one batch that yields
+    `yield_per_batch` pieces; each package uses one packaging material unit.
+    Raises KeyError with the product id if a product does not exist.
+    """
+    products = {
+        product.product_id: product
+        for product in db.query(models.Product).filter(models.Product.product_id.in_(packages_by_product)).all()
+    }
+    for product_id in packages_by_product:
+        if product_id not in products:
+            raise KeyError(product_id)
+
+    recipe_ids = {product.recipe_id for product in products.values() if product.recipe_id is not None}
+    recipes = {
+        recipe.recipe_id: recipe
+        for recipe in db.query(models.Recipe).filter(models.Recipe.recipe_id.in_(recipe_ids)).all()
+    }
+    details_by_recipe, ingredients = load_recipe_details(db, recipe_ids)
+    egg_master = db.query(models.EggMaster).order_by(models.EggMaster.egg_id).first()
+    material_ids = {product.packaging_material_id for product in products.values() if product.packaging_material_id is not None}
+    materials = {
+        material.packaging_material_id: material
+        for material in db.query(models.PackagingMaterial).filter(
+            models.PackagingMaterial.packaging_material_id.in_(material_ids)
+        ).all()
+    }
+    ingredient_prices = latest_ingredient_prices(db, list(ingredients))
+    packaging_prices = latest_packaging_prices(db, list(materials))
+
+    grams_by_ingredient = defaultdict(Decimal)
+    units_by_material = defaultdict(int)
+    product_rows = []
+    for product_id, packages in packages_by_product.items():
+        product = products[product_id]
+        pieces = packages * product.pieces_per_package
+        recipe = recipes.get(product.recipe_id)
+        batches = Decimal(pieces) / recipe.yield_per_batch if recipe is not None else Decimal("0")
+        product_cost = Decimal("0")
+
+        for detail in details_by_recipe.get(product.recipe_id, []):
+            ingredient = ingredients[detail.ingredient_id]
+            grams = usage_in_grams(detail, ingredient, egg_master) * batches
+            grams_by_ingredient[ingredient.ingredient_id] += grams
+            if ingredient.ingredient_id in ingredient_prices:
+                product_cost += grams / pack_size_in_grams(ingredient) * ingredient_prices[ingredient.ingredient_id]
+
+        material = materials.get(product.packaging_material_id)
+        if material is not None:
+            units_by_material[material.packaging_material_id] += packages
+            if material.packaging_material_id in packaging_prices:
+                product_cost += Decimal(packages) / material.quantity * packaging_prices[material.packaging_material_id]
+
+        product_rows.append({
+            "product_id": product_id,
+            "product_name": product.product_name,
+            "packages": packages,
+            "pieces": pieces,
+            "batches": batches.quantize(QUANTITY_PRECISION),
+            "estimated_cost": product_cost.quantize(COST_PRECISION),
+        })
+
+    ingredient_rows = []
+    for ingredient_id, grams in grams_by_ingredient.items():
+        ingredient = ingredients[ingredient_id]
+        packs_needed = grams / pack_size_in_grams(ingredient)
+        purchase_packs = _ceil(packs_needed)
+        price = ingredient_prices.get(ingredient_id)
+        ingredient_rows.append({
+            "ingredient_id": ingredient_id,
+            "recipe_display_name": ingredient.recipe_display_name,
+            "required_quantity": (packs_needed * ingredient.quantity).quantize(QUANTITY_PRECISION),
+            "quantity_unit": ingredient.quantity_unit,
+            "purchase_packs": purchase_packs,
+            "purchase_quantity": purchase_packs * ingredient.quantity,
+            "unit_price": price.quantize(COST_PRECISION) if price is not None else None,
+            "estimated_cost": (packs_needed * price).quantize(COST_PRECISION) if price is not None else Decimal("0.00"),
+        })
+
+    packaging_rows = []
+    for material_id, units in units_by_material.items():
+        material = materials[material_id]
+        purchase_packs = _ceil(Decimal(units) / material.quantity)
+        price = packaging_prices.get(material_id)
+        packaging_rows.append({
+            "packaging_material_id": material_id,
+            "recipe_display_name": material.recipe_display_name,
+            "required_quantity": units,
+            "quantity_unit": material.quantity_unit,
+            "purchase_packs": purchase_packs,
+            "purchase_quantity": purchase_packs * material.quantity,
+            "unit_price": price.quantize(COST_PRECISION) if price is not None else None,
+            "estimated_cost": (Decimal(units) / material.quantity * price).quantize(COST_PRECISION) if price is not None else Decimal("0.00"),
+        })
+
+    total_cost = sum((row["estimated_cost"] for row in ingredient_rows + packaging_rows), Decimal("0.00"))
+    return {
+        "products": product_rows,
+        "ingredients": ingredient_rows,
+        "packaging": packaging_rows,
+        "total_cost": total_cost,
+    }
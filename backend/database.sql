@@ -114,6 +114,50 @@ CREATE TABLE packaging_purchase_history (
     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
+-- Tombstones for deleted rows (consumed by the /sync endpoint)
+CREATE TABLE deleted_records (
+    id SERIAL PRIMARY KEY,
+    table_name VARCHAR(50) NOT NULL,
+    record_id INTEGER NOT NULL,
+    deleted_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Per-table change counters for cache invalidation on databases without LISTEN/NOTIFY
+CREATE TABLE cache_versions (
+    table_name VARCHAR(50) PRIMARY KEY,
+    version INTEGER NOT NULL DEFAULT 0
+);
+
+-- Periodic recipe/product cost snapshots (product_id is NULL for recipe-level rows)
+CREATE TABLE recipe_cost_snapshots (
+    id SERIAL PRIMARY KEY,
+    snapshot_date DATE NOT NULL,
+    recipe_id INTEGER NOT NULL,
+    product_id INTEGER,
+    batch_cost DECIMAL(12,2) NOT NULL,
+    unit_cost DECIMAL(12,4) NOT NULL,
+    package_cost DECIMAL(12,2),
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Background jobs
+CREATE TABLE jobs (
+    job_id SERIAL PRIMARY KEY,
+    kind VARCHAR(50) NOT NULL,
+    status VARCHAR(20) DEFAULT 'pending' CHECK (status IN ('pending', 'running', 'succeeded', 'failed', 'cancelled')),
+    progress INTEGER NOT NULL DEFAULT 0,
+    params JSON,
+    result JSON,
+    error TEXT,
+    cancel_requested BOOLEAN NOT NULL DEFAULT FALSE,
+    owner VARCHAR(100),
+    heartbeat_at TIMESTAMP,
+    started_at TIMESTAMP,
+    finished_at TIMESTAMP,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
 -- Insert default egg master data
 INSERT INTO egg_master (whole_egg_weight, egg_white_weight, egg_yolk_weight) 
 VALUES (50.00, 30.00, 20.00);
@@ -123,4 +167,19 @@ CREATE INDEX idx_purchase_history_ingredient_date ON purchase_history(ingredient
 CREATE INDEX idx_recipe_details_recipe_id ON recipe_details(recipe_id);
 CREATE INDEX idx_recipes_category_id ON recipes(category_id);
 CREATE INDEX idx_packaging_purchase_history_material_date ON packaging_purchase_history(packaging_material_id, purchase_date);
-CREATE INDEX idx_recipe_details_egg_type ON recipe_details(egg_type);
\ No newline at end of file
+CREATE INDEX idx_recipe_details_egg_type ON recipe_details(egg_type);
+CREATE INDEX idx_recipe_categories_updated_at ON recipe_categories(updated_at);
+CREATE INDEX idx_ingredients_updated_at ON ingredients(updated_at);
+CREATE INDEX idx_purchase_history_updated_at ON purchase_history(updated_at);
+CREATE INDEX idx_packaging_materials_updated_at ON packaging_materials(updated_at);
+CREATE INDEX idx_egg_master_updated_at ON egg_master(updated_at);
+CREATE INDEX idx_recipes_updated_at ON recipes(updated_at);
+CREATE INDEX idx_recipe_details_updated_at ON recipe_details(updated_at);
+CREATE INDEX idx_products_updated_at ON products(updated_at);
+CREATE INDEX idx_packaging_purchase_history_updated_at ON packaging_purchase_history(updated_at);
+CREATE INDEX idx_deleted_records_deleted_at ON deleted_records(deleted_at);
+CREATE INDEX idx_recipe_cost_snapshots_recipe_date ON recipe_cost_snapshots(recipe_id, snapshot_date);
+CREATE INDEX idx_recipe_cost_snapshots_date ON recipe_cost_snapshots(snapshot_date);
+CREATE UNIQUE INDEX uq_recipe_cost_snapshots_recipe ON recipe_cost_snapshots(snapshot_date, recipe_id) WHERE product_id IS NULL;
+CREATE UNIQUE INDEX uq_recipe_cost_snapshots_product ON recipe_cost_snapshots(snapshot_date, product_id) WHERE product_id IS NOT NULL;
+CREATE INDEX idx_jobs_status ON jobs(status);
\ No newline at end of file
@@ -0,0 +1,280 @@
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+from decimal import Decimal
+
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy import func, or_, select
+from sqlalchemy.orm import Session
+
+from database import SessionLocal
+import costing
+import models
+import snapshots
+
+logger = logging.getLogger(__name__)
+
+JOB_CONCURRENCY = int(os.getenv("JOB_CONCURRENCY", "2"))
+JOB_HEARTBEAT_INTERVAL = float(os.getenv("JOB_HEARTBEAT_INTERVAL", "10"))
+# Running jobs without a heartbeat for this long are assumed to belong to a dead worker
+JOB_STALE_SECONDS = int(os.getenv("JOB_STALE_SECONDS", "30"))
+
+JOB_HANDLERS = {}
+
+
+class JobCancelled(Exception):
+    pass
+
+
+def job_handler(kind):
+    """Register a function(db, params, ctx) returning a JSON-serializable result as a job kind."""
+    def register(fn):
+        JOB_HANDLERS[kind] = fn
+        return fn
+    return register
+
+
+class JobContext:
+    """Handed to job handlers to report progress and notice cancellation."""
+
+    def __init__(self, job_id):
+        self.job_id = job_id
+
+    def set_progress(self, progress):
+        """Store progress (0-100). Raises JobCancelled if cancellation was requested."""
+        # A separate session so that progress is visible before the job's own transaction commits
+        with SessionLocal() as db:
+            job = db.get(models.Job, self.job_id)
+            job.progress = progress
+            cancel_requested = job.cancel_requested
+            db.commit()
+        if cancel_requested:
+            raise JobCancelled()
+
+
+class JobRunner:
+    """
+    Runs jobs from the jobs table on a bounded thread pool. A monitor thread
+    sends heartbeats for this worker's jobs, requeues jobs whose worker stopped
+    sending them and picks up pending jobs submitted through other workers.
+    """
+
+    def __init__(self, max_workers):
+        self.max_workers = max_workers
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._executor = None
+        self._stop_event = None
+        self._lock = threading.Lock()
+        self._queued = set()
+        # Jobs claimed by this runner whose thread has not returned yet
+        self._running = set()
+
+    def submit(self, job_id):
+        with self._lock:
+            # Before start and after shutdown the job stays pending for the next start or another worker
+            if job_id in self._queued or self._stop_event is None or self._stop_event.is_set():
+                return
+            self._queued.add(job_id)
+            self._executor.submit(self._run, job_id)
+
+    def start(self):
+        """Start the thread pool and the monitor thread."""
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="job")
+        self._stop_event = threading.Event()
+        threading.Thread(target=self._monitor, args=(self._stop_event,), name="job-monitor", daemon=True).start()
+
+    def shutdown(self):
+        with self._lock:
+            self._stop_event.set()
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._queued.clear()
+
+    def scan(self):
+        """Send heartbeats, requeue jobs of dead workers and queue every pending job."""
+        with SessionLocal() as db:
+            self._heartbeat(db)
+            # Compared against the database clock, the one every heartbeat is written with
+            stale_before = db.scalar(select(func.now())) - timedelta(seconds=JOB_STALE_SECONDS)
+            db.query(models.Job).filter(
+                models.Job.status == "running",
+                or_(models.Job.heartbeat_at.is_(None), models.Job.heartbeat_at < stale_before),
+            ).update({"status": "pending", "owner": None}, synchronize_session=False)
+            db.commit()
+            job_ids = [job_id for (job_id,) in db.query(models.Job.job_id).filter(
+                models.Job.status == "pending"
+            ).order_by(models.Job.job_id).all()]
+        for job_id in job_ids:
+            self.submit(job_id)
+
+    def _heartbeat(self, db):
+        with self._lock:
+            running = list(self._running)
+        if running:
+            db.query(models.Job).filter(
+                models.Job.job_id.in_(running), models.Job.owner == self.worker_id, models.Job.status == "running"
+            ).update({"heartbeat_at": func.now()}, synchronize_session=False)
+
+    def _monitor(self, stop_event):
+        while not stop_event.is_set():
+            try:
+                self.scan()
+            except Exception:
+                logger.exception("Job monitor failed")
+            stop_event.wait(JOB_HEARTBEAT_INTERVAL)
+
+        # Jobs already running are finished by the executor threads after shutdown.
+        # Keep them alive so that no other worker takes them over and runs them again.
+        while True:
+            with self._lock:
+                if not self._running:
+                    return
+            try:
+                with SessionLocal() as db:
+                    self._heartbeat(db)
+                    db.commit()
+            except Exception:
+                logger.exception("Job heartbeat failed")
+            time.sleep(JOB_HEARTBEAT_INTERVAL)
+
+    def _run(self, job_id):
+        try:
+            self._execute(job_id)
+        except Exception:
+            # Nobody waits on the executor futures, so this would be lost otherwise
+            logger.exception("Job %s could not be run", job_id)
+        finally:
+            with self._lock:
+                self._queued.discard(job_id)
+                self._running.discard(job_id)
+
+    def _execute(self, job_id):
+        with SessionLocal() as db:
+            # Claiming with a conditional update lets several workers resume the same jobs safely
+            claimed = db.query(models.Job).filter(
+                models.Job.job_id == job_id, models.Job.status == "pending"
+            ).update({
+                "status": "running",
+                "owner": self.worker_id,
+                "heartbeat_at": func.now(),
+                "started_at": func.now(),
+            }, synchronize_session=False)
+            db.commit()
+            if not claimed:
+                return
+            with self._lock:
+                self._running.add(job_id)
+
+            job = db.get(models.Job, job_id)
+            kind = job.kind
+            try:
+                result = JOB_HANDLERS[kind](db, job.params or {}, JobContext(job_id))
+                db.commit()
+                values = {"status": "succeeded", "progress": 100, "result": jsonable_encoder(result)}
+            except JobCancelled:
+                db.rollback()
+                values = {"status": "cancelled"}
+            except Exception as e:
+                logger.exception("Job %s (%s) failed", job_id, kind)
+                db.rollback()
+                values = {"status": "failed", "error": str(e)}
+
+            try:
+                # Only while the job is still ours, in case it was requeued and taken over meanwhile
+                stored = db.query(models.Job).filter(
+                    models.Job.job_id == job_id, models.Job.owner == self.worker_id, models.Job.status == "running"
+                ).update({**values, "finished_at": func.now()}, synchronize_session=False)
+                db.commit()
+                if not stored:
+                    logger.warning("Job %s (%s) was taken over by another worker, outcome discarded", job_id, kind)
+            except Exception:
+                # The job stops getting heartbeats and is requeued once it goes stale
+                logger.exception("Could not store the outcome of job %s (%s)", job_id, kind)
+                db.rollback()
+
+
+job_runner = JobRunner(JOB_CONCURRENCY)
+
+
+@job_handler("cost-snapshots")
+def rebuild_cost_snapshots(db: Session, params, ctx: JobContext):
+    """
+    Write missed cost snapshots, or rewrite every snapshot from `since` when given.
+    Each date is committed on its own, so a cancelled rebuild leaves no gaps behind
+    and the periodic catch-up continues where it stopped.
+    """
+    today = date.today()
+    if params.get("since"):
+        since = date.fromisoformat(params["since"])
+        # Don't delete under a writer that is in the middle of writing these dates
+        if not snapshots.try_lock(db):
+            raise RuntimeError("Cost snapshots are being written by another worker")
+        db.query(models.RecipeCostSnapshot).filter(
+            models.RecipeCostSnapshot.snapshot_date >= since
+        ).delete(synchronize_session=False)
+        db.commit()
+        snapshot_dates = [
+            since + timedelta(days=days)
+            for days in range(0, (today - since).days, snapshots.SNAPSHOT_INTERVAL_DAYS)
+        ]
+    else:
+        snapshot_dates = snapshots.pending_snapshot_dates(db, today)
+
+    for index, snapshot_date in enumerate(snapshot_dates):
+        ctx.set_progress(index * 100 // len(snapshot_dates))
+        if not snapshots.try_lock(db):
+            raise RuntimeError("Cost snapshots are being written by another worker")
+        snapshots.write_snapshots(db, [snapshot_date])
+        db.commit()
+    return {"dates_written": len(snapshot_dates)}
+
+
+@job_handler("profitability")
+def compute_profitability(db: Session, params, ctx: JobContext):
+    """Package cost and margin of every product at current prices, highest margin first."""
+    products = db.query(models.Product).filter(models.Product.recipe_id.isnot(None)).all()
+    recipes = {recipe.recipe_id: recipe for recipe in db.query(models.Recipe).all()}
+    details_by_recipe, ingredients = costing.load_recipe_details(db, list(recipes))
+    egg_master = db.query(models.EggMaster).order_by(models.EggMaster.egg_id).first()
+    materials = {material.packaging_material_id: material for material in db.query(models.PackagingMaterial).all()}
+    ctx.set_progress(50)
+
+    batch_costs = costing.recipe_batch_costs(
+        details_by_recipe, ingredients, egg_master, costing.latest_ingredient_prices(db, list(ingredients))
+    )
+    packaging_prices = costing.latest_packaging_prices(db, list(materials))
+
+    rows = []
+    for product in products:
+        recipe = recipes.get(product.recipe_id)
+        if recipe is None:
+            continue
+        unit_cost = batch_costs.get(recipe.recipe_id, Decimal("0")) / recipe.yield_per_batch
+        cost = costing.package_cost(product, unit_cost, materials.get(product.packaging_material_id), packaging_prices)
+        margin = None
+        if product.selling_price:
+            margin = ((product.selling_price - cost) / product.selling_price).quantize(Decimal("0.0001"))
+        rows.append({
+            "product_id": product.product_id,
+            "product_name": product.product_name,
+            "package_cost": cost.quantize(costing.COST_PRECISION),
+            "selling_price": product.selling_price,
+            "profit_margin": margin,
+        })
+    rows.sort(key=lambda row: (row["profit_margin"] is None, -(row["profit_margin"] or 0)))
+    return rows
+
+
+@job_handler("export")
+def export_tables(db: Session, params, ctx: JobContext):
+    """Every row of every table except jobs, keyed by table name."""
+    tables = [table for table in models.Base.metadata.sorted_tables if table.name != models.Job.__tablename__]
+    result = {}
+    for index, table in enumerate(tables):
+        ctx.set_progress(index * 100 // len(tables))
+        result[table.name] = [dict(row._mapping) for row in db.execute(table.select())]
+    return result
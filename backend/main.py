@@ -1,16 +1,41 @@
-from fastapi import FastAPI, Depends, HTTPException
+from fastapi import FastAPI, Body, Depends, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from sqlalchemy import String, func, select, text, type_coerce
 from sqlalchemy.orm import Session
-from typing import List
+from typing import Any, Dict, List, Optional
+from datetime import date, datetime
+from contextlib import asynccontextmanager
+import os
 
-from database import SessionLocal, engine, get_db
-from models import Base
+from database import INIT_SCHEMA, IS_SQLITE, SessionLocal, get_db, init_schema
 import models
 import schemas
-
-Base.metadata.create_all(bind=engine)
-
-app = FastAPI(title="Recipe Manager API", version="1.0.0")
+from cache import local_cache, publish_change, start_change_listener
+from singleflight import single_flight
+import costing
+from snapshots import start_snapshot_worker
+from jobs import JOB_HANDLERS, job_runner
+
+def prewarm_caches():
+    """Load the small master tables into the local cache before the first request."""
+    with SessionLocal() as db:
+        read_egg_masters(db=db)
+        read_recipe_categories(db=db)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if INIT_SCHEMA:
+        init_schema()
+    change_listener_stop = start_change_listener()
+    prewarm_caches()
+    snapshot_worker_stop = start_snapshot_worker()
+    job_runner.start()
+    yield
+    job_runner.shutdown()
+    snapshot_worker_stop.set()
+    change_listener_stop.set()
+
+app = FastAPI(title="Recipe Manager API", version="1.0.0", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -20,6 +45,52 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Tables exposed through the /sync endpoint
+SYNC_TABLES = {
+    "recipe_categories": (models.RecipeCategory, schemas.RecipeCategory),
+    "ingredients": (models.Ingredient, schemas.Ingredient),
+    "purchase_history": (models.PurchaseHistory, schemas.PurchaseHistory),
+    "egg_master": (models.EggMaster, schemas.EggMaster),
+    "recipes": (models.Recipe, schemas.Recipe),
+    "recipe_details": (models.RecipeDetail, schemas.RecipeDetail),
+    "packaging_materials": (models.PackagingMaterial, schemas.PackagingMaterial),
+    "products": (models.Product, schemas.Product),
+}
+
+def record_deletion(db: Session, table_name: str, record_id: int):
+    """Leave a tombstone so that /sync clients learn about the deleted row."""
+    db.add(models.DeletedRecord(table_name=table_name, record_id=record_id))
+
+# SQLite cannot see other connections' open transactions, so its tokens trail the clock by this much
+SYNC_OVERLAP_SECONDS = int(os.getenv("SYNC_OVERLAP_SECONDS", "5"))
+
+def current_sync_token(db: Session):
+    """
+    Point from which the next sync has to read. Every change not yet visible to
+    this session is stamped at or after it. Changes shortly before it may be
+    sent twice, so clients apply them by id.
+    """
+    if IS_SQLITE:
+        token = db.execute(select(func.datetime("now", f"-{SYNC_OVERLAP_SECONDS} seconds"))).scalar()
+        return datetime.fromisoformat(token)
+    # now() is the transaction start, so open transactions stamp their rows with their start time
+    return db.execute(text(
+        "SELECT LEAST(now(), min(xact_start)) FROM pg_stat_activity WHERE datname = current_database()"
+    )).scalar()
+
+def changed_since(column, since_time: datetime):
+    if IS_SQLITE:
+        # CURRENT_TIMESTAMP is stored as second-precision text, compare in the same format
+        return type_coerce(column, String) >= since_time.strftime("%Y-%m-%d %H:%M:%S")
+    return column >= since_time
+
+def coalesced(key, tables, load):
+    """
+    Share one run of `load` between concurrent identical requests. The table
+    versions are part of the key, so reads arriving after a write start afresh.
+    """
+    return single_flight.do(key + local_cache.versions(tables), load)
+
 # Health check endpoint
 @app.get("/")
 def read_root():
@@ -34,14 +105,19 @@ def health_check():
 def create_egg_master(egg_master: schemas.EggMasterCreate, db: Session = Depends(get_db)):
     db_egg_master = models.EggMaster(**egg_master.dict())
     db.add(db_egg_master)
+    db.flush()
+    publish_change(db, "egg_master", db_egg_master.egg_id)
     db.commit()
     db.refresh(db_egg_master)
     return db_egg_master
 
 @app.get("/egg-master/", response_model=List[schemas.EggMaster])
 def read_egg_masters(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    egg_masters = db.query(models.EggMaster).offset(skip).limit(limit).all()
-    return egg_masters
+    def load():
+        egg_masters = db.query(models.EggMaster).offset(skip).limit(limit).all()
+        return [schemas.EggMaster.model_validate(egg_master) for egg_master in egg_masters]
+    key = ("egg_master", skip, limit)
+    return local_cache.get_or_load(key, ["egg_master"], lambda: coalesced(key, ["egg_master"], load))
 
 @app.get("/egg-master/{egg_id}", response_model=schemas.EggMaster)
 def read_egg_master(egg_id: int, db: Session = Depends(get_db)):
@@ -60,6 +136,7 @@ def update_egg_master(egg_id: int, egg_master: schemas.EggMasterUpdate, db: Sess
     for field, value in update_data.items():
         setattr(db_egg_master, field, value)
     
+    publish_change(db, "egg_master", db_egg_master.egg_id)
     db.commit()
     db.refresh(db_egg_master)
     return db_egg_master
@@ -70,7 +147,9 @@ def delete_egg_master(egg_id: int, db: Session = Depends(get_db)):
     if db_egg_master is None:
         raise HTTPException(status_code=404, detail="Egg master not found")
     
+    record_deletion(db, "egg_master", db_egg_master.egg_id)
     db.delete(db_egg_master)
+    publish_change(db, "egg_master", egg_id)
     db.commit()
     return {"message": "Egg master deleted successfully"}
 
@@ -79,14 +158,19 @@ def delete_egg_master(egg_id: int, db: Session = Depends(get_db)):
 def create_recipe_category(category: schemas.RecipeCategoryCreate, db: Session = Depends(get_db)):
     db_category = models.RecipeCategory(**category.dict())
     db.add(db_category)
+    db.flush()
+    publish_change(db, "recipe_categories", db_category.category_id)
     db.commit()
     db.refresh(db_category)
     return db_category
 
 @app.get("/recipe-categories/", response_model=List[schemas.RecipeCategory])
 def read_recipe_categories(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    categories = db.query(models.RecipeCategory).offset(skip).limit(limit).all()
-    return categories
+    def load():
+        categories = db.query(models.RecipeCategory).offset(skip).limit(limit).all()
+        return [schemas.RecipeCategory.model_validate(category) for category in categories]
+    key = ("recipe_categories", skip, limit)
+    return local_cache.get_or_load(key, ["recipe_categories"], lambda: coalesced(key, ["recipe_categories"], load))
 
 @app.get("/recipe-categories/{category_id}", response_model=schemas.RecipeCategory)
 def read_recipe_category(category_id: int, db: Session = Depends(get_db)):
@@ -100,14 +184,19 @@ def read_recipe_category(category_id: int, db: Session = Depends(get_db)):
 def create_ingredient(ingredient: schemas.IngredientCreate, db: Session = Depends(get_db)):
     db_ingredient = models.Ingredient(**ingredient.dict())
     db.add(db_ingredient)
+    db.flush()
+    publish_change(db, "ingredients", db_ingredient.ingredient_id)
     db.commit()
     db.refresh(db_ingredient)
     return db_ingredient
 
 @app.get("/ingredients/", response_model=List[schemas.Ingredient])
 def read_ingredients(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    ingredients = db.query(models.Ingredient).offset(skip).limit(limit).all()
-    return ingredients
+    def load():
+        ingredients = db.query(models.Ingredient).offset(skip).limit(limit).all()
+        return [schemas.Ingredient.model_validate(ingredient) for ingredient in ingredients]
+    key = ("ingredients", skip, limit)
+    return local_cache.get_or_load(key, ["ingredients"], lambda: coalesced(key, ["ingredients"], load))
 
 @app.get("/ingredients/{ingredient_id}", response_model=schemas.Ingredient)
 def read_ingredient(ingredient_id: int, db: Session = Depends(get_db)):
@@ -126,6 +215,7 @@ def update_ingredient(ingredient_id: int, ingredient: schemas.IngredientUpdate,
     for field, value in update_data.items():
         setattr(db_ingredient, field, value)
     
+    publish_change(db, "ingredients", db_ingredient.ingredient_id)
     db.commit()
     db.refresh(db_ingredient)
     return db_ingredient
@@ -136,7 +226,9 @@ def delete_ingredient(ingredient_id: int, db: Session = Depends(get_db)):
     if db_ingredient is None:
         raise HTTPException(status_code=404, detail="Ingredient not found")
     
+    record_deletion(db, "ingredients", db_ingredient.ingredient_id)
     db.delete(db_ingredient)
+    publish_change(db, "ingredients", ingredient_id)
     db.commit()
     return {"message": "Ingredient deleted successfully"}
 
@@ -145,25 +237,29 @@ def delete_ingredient(ingredient_id: int, db: Session = Depends(get_db)):
 def create_purchase_history(purchase: schemas.PurchaseHistoryCreate, db: Session = Depends(get_db)):
     db_purchase = models.PurchaseHistory(**purchase.dict())
     db.add(db_purchase)
+    db.flush()
+    publish_change(db, "purchase_history", db_purchase.id)
     db.commit()
     db.refresh(db_purchase)
     return db_purchase
 
 @app.get("/purchase-history/", response_model=List[schemas.PurchaseHistory])
 def read_purchase_history(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    purchases = db.query(models.PurchaseHistory).offset(skip).limit(limit).all()
-    return purchases
+    def load():
+        purchases = db.query(models.PurchaseHistory).offset(skip).limit(limit).all()
+        return [schemas.PurchaseHistory.model_validate(purchase) for purchase in purchases]
+    return coalesced(("purchase_history", skip, limit), ["purchase_history"], load)
 
 @app.get("/purchase-history/{purchase_id}", response_model=schemas.PurchaseHistory)
 def read_purchase_history_item(purchase_id: int, db: Session = Depends(get_db)):
-    purchase = db.query(models.PurchaseHistory).filter(models.PurchaseHistory.purchase_id == purchase_id).first()
+    purchase = db.query(models.PurchaseHistory).filter(models.PurchaseHistory.id == purchase_id).first()
     if purchase is None:
         raise HTTPException(status_code=404, detail="Purchase history not found")
     return purchase
 
 @app.put("/purchase-history/{purchase_id}", response_model=schemas.PurchaseHistory)
 def update_purchase_history(purchase_id: int, purchase: schemas.PurchaseHistoryUpdate, db: Session = Depends(get_db)):
-    db_purchase = db.query(models.PurchaseHistory).filter(models.PurchaseHistory.purchase_id == purchase_id).first()
+    db_purchase = db.query(models.PurchaseHistory).filter(models.PurchaseHistory.id == purchase_id).first()
     if db_purchase is None:
         raise HTTPException(status_code=404, detail="Purchase history not found")
     
@@ -171,17 +267,20 @@ def update_purchase_history(purchase_id: int, purchase: schemas.PurchaseHistoryU
     for field, value in update_data.items():
         setattr(db_purchase, field, value)
     
+    publish_change(db, "purchase_history", db_purchase.id)
     db.commit()
     db.refresh(db_purchase)
     return db_purchase
 
 @app.delete("/purchase-history/{purchase_id}")
 def delete_purchase_history(purchase_id: int, db: Session = Depends(get_db)):
-    db_purchase = db.query(models.PurchaseHistory).filter(models.PurchaseHistory.purchase_id == purchase_id).first()
+    db_purchase = db.query(models.PurchaseHistory).filter(models.PurchaseHistory.id == purchase_id).first()
     if db_purchase is None:
         raise HTTPException(status_code=404, detail="Purchase history not found")
     
+    record_deletion(db, "purchase_history", db_purchase.id)
     db.delete(db_purchase)
+    publish_change(db, "purchase_history", purchase_id)
     db.commit()
     return {"message": "Purchase history deleted successfully"}
 
@@ -190,14 +289,18 @@ def delete_purchase_history(purchase_id: int, db: Session = Depends(get_db)):
 def create_recipe(recipe: schemas.RecipeCreate, db: Session = Depends(get_db)):
     db_recipe = models.Recipe(**recipe.dict())
     db.add(db_recipe)
+    db.flush()
+    publish_change(db, "recipes", db_recipe.recipe_id)
     db.commit()
     db.refresh(db_recipe)
     return db_recipe
 
 @app.get("/recipes/", response_model=List[schemas.Recipe])
 def read_recipes(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    recipes = db.query(models.Recipe).offset(skip).limit(limit).all()
-    return recipes
+    def load():
+        recipes = db.query(models.Recipe).offset(skip).limit(limit).all()
+        return [schemas.Recipe.model_validate(recipe) for recipe in recipes]
+    return coalesced(("recipes", skip, limit), ["recipes"], load)
 
 @app.get("/recipes/{recipe_id}", response_model=schemas.Recipe)
 def read_recipe(recipe_id: int, db: Session = Depends(get_db)):
@@ -216,6 +319,7 @@ def update_recipe(recipe_id: int, recipe: schemas.RecipeUpdate, db: Session = De
     for field, value in update_data.items():
         setattr(db_recipe, field, value)
     
+    publish_change(db, "recipes", db_recipe.recipe_id)
     db.commit()
     db.refresh(db_recipe)
     return db_recipe
@@ -227,9 +331,15 @@ def delete_recipe(recipe_id: int, db: Session = Depends(get_db)):
         raise HTTPException(status_code=404, detail="Recipe not found")
     
     # Delete associated recipe details first
+    detail_ids = db.query(models.RecipeDetail.id).filter(models.RecipeDetail.recipe_id == recipe_id).all()
+    for (detail_id,) in detail_ids:
+        record_deletion(db, "recipe_details", detail_id)
     db.query(models.RecipeDetail).filter(models.RecipeDetail.recipe_id == recipe_id).delete()
     
+    record_deletion(db, "recipes", db_recipe.recipe_id)
     db.delete(db_recipe)
+    publish_change(db, "recipe_details")
+    publish_change(db, "recipes", recipe_id)
     db.commit()
     return {"message": "Recipe deleted successfully"}
 
@@ -275,9 +385,34 @@ def duplicate_recipe(recipe_id: int, duplicate_data: schemas.RecipeDuplicate, db
         db_new_detail = models.RecipeDetail(**new_detail_data)
         db.add(db_new_detail)
     
+    publish_change(db, "recipe_details")
+    publish_change(db, "recipes", db_new_recipe.recipe_id)
     db.commit()
     return db_new_recipe
 
+@app.get("/recipes/{recipe_id}/cost-history", response_model=List[schemas.RecipeCostSnapshot])
+def read_recipe_cost_history(
+    recipe_id: int,
+    product_id: Optional[int] = None,
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    db: Session = Depends(get_db),
+):
+    """
+    Get the recorded cost snapshots of a recipe, oldest first.
+    With `product_id`, the snapshots of that product of the recipe are returned instead.
+    """
+    query = db.query(models.RecipeCostSnapshot).filter(models.RecipeCostSnapshot.recipe_id == recipe_id)
+    if product_id is None:
+        query = query.filter(models.RecipeCostSnapshot.product_id.is_(None))
+    else:
+        query = query.filter(models.RecipeCostSnapshot.product_id == product_id)
+    if start_date is not None:
+        query = query.filter(models.RecipeCostSnapshot.snapshot_date >= start_date)
+    if end_date is not None:
+        query = query.filter(models.RecipeCostSnapshot.snapshot_date <= end_date)
+    return query.order_by(models.RecipeCostSnapshot.snapshot_date).all()
+
 @app.get("/recipes/{recipe_id}/details", response_model=List[schemas.RecipeDetail])
 def read_recipe_details(recipe_id: int, db: Session = Depends(get_db)):
     details = db.query(models.RecipeDetail).filter(models.RecipeDetail.recipe_id == recipe_id).order_by(models.RecipeDetail.display_order).all()
@@ -292,24 +427,30 @@ def read_batch_recipe_details(recipe_ids: List[int], db: Session = Depends(get_d
     if not recipe_ids:
         return {}
     
-    details = db.query(models.RecipeDetail).filter(
-        models.RecipeDetail.recipe_id.in_(recipe_ids)
-    ).order_by(models.RecipeDetail.recipe_id, models.RecipeDetail.display_order).all()
+    unique_ids = sorted(set(recipe_ids))
     
-    # Group details by recipe_id
-    result = {}
-    for detail in details:
-        if detail.recipe_id not in result:
-            result[detail.recipe_id] = []
-        result[detail.recipe_id].append(detail)
+    def load():
+        details = db.query(models.RecipeDetail).filter(
+            models.RecipeDetail.recipe_id.in_(unique_ids)
+        ).order_by(models.RecipeDetail.recipe_id, models.RecipeDetail.display_order).all()
+        
+        # Group details by recipe_id
+        result = {}
+        for detail in details:
+            if detail.recipe_id not in result:
+                result[detail.recipe_id] = []
+            result[detail.recipe_id].append(schemas.RecipeDetail.model_validate(detail))
+        return result
     
-    return result
+    return coalesced(("recipe_batch_details", tuple(unique_ids)), ["recipe_details"], load)
 
 # Recipe Details endpoints
 @app.post("/recipe-details/", response_model=schemas.RecipeDetail)
 def create_recipe_detail(detail: schemas.RecipeDetailCreate, db: Session = Depends(get_db)):
     db_detail = models.RecipeDetail(**detail.dict())
     db.add(db_detail)
+    db.flush()
+    publish_change(db, "recipe_details", db_detail.id)
     db.commit()
     db.refresh(db_detail)
     return db_detail
@@ -329,6 +470,7 @@ def update_recipe_detail(detail_id: int, detail: schemas.RecipeDetailUpdate, db:
     for field, value in update_data.items():
         setattr(db_detail, field, value)
     
+    publish_change(db, "recipe_details", db_detail.id)
     db.commit()
     db.refresh(db_detail)
     return db_detail
@@ -339,37 +481,29 @@ def delete_recipe_detail(detail_id: int, db: Session = Depends(get_db)):
     if db_detail is None:
         raise HTTPException(status_code=404, detail="Recipe detail not found")
     
+    record_deletion(db, "recipe_details", db_detail.id)
     db.delete(db_detail)
+    publish_change(db, "recipe_details", detail_id)
     db.commit()
     return {"message": "Recipe detail deleted successfully"}
 
-# Recipe Categories endpoints
-@app.get("/recipe-categories/", response_model=List[schemas.RecipeCategory])
-def read_recipe_categories(db: Session = Depends(get_db)):
-    categories = db.query(models.RecipeCategory).all()
-    return categories
-
-@app.post("/recipe-categories/", response_model=schemas.RecipeCategory)
-def create_recipe_category(category: schemas.RecipeCategoryCreate, db: Session = Depends(get_db)):
-    db_category = models.RecipeCategory(**category.dict())
-    db.add(db_category)
-    db.commit()
-    db.refresh(db_category)
-    return db_category
-
 # Packaging Materials endpoints
 @app.post("/packaging-materials/", response_model=schemas.PackagingMaterial)
 def create_packaging_material(material: schemas.PackagingMaterialCreate, db: Session = Depends(get_db)):
     db_material = models.PackagingMaterial(**material.dict())
     db.add(db_material)
+    db.flush()
+    publish_change(db, "packaging_materials", db_material.packaging_material_id)
     db.commit()
     db.refresh(db_material)
     return db_material
 
 @app.get("/packaging-materials/", response_model=List[schemas.PackagingMaterial])
 def read_packaging_materials(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    materials = db.query(models.PackagingMaterial).offset(skip).limit(limit).all()
-    return materials
+    def load():
+        materials = db.query(models.PackagingMaterial).offset(skip).limit(limit).all()
+        return [schemas.PackagingMaterial.model_validate(material) for material in materials]
+    return coalesced(("packaging_materials", skip, limit), ["packaging_materials"], load)
 
 @app.get("/packaging-materials/{material_id}", response_model=schemas.PackagingMaterial)
 def read_packaging_material(material_id: int, db: Session = Depends(get_db)):
@@ -388,6 +522,7 @@ def update_packaging_material(material_id: int, material: schemas.PackagingMater
     for field, value in update_data.items():
         setattr(db_material, field, value)
     
+    publish_change(db, "packaging_materials", db_material.packaging_material_id)
     db.commit()
     db.refresh(db_material)
     return db_material
@@ -398,7 +533,9 @@ def delete_packaging_material(material_id: int, db: Session = Depends(get_db)):
     if db_material is None:
         raise HTTPException(status_code=404, detail="Packaging material not found")
     
+    record_deletion(db, "packaging_materials", db_material.packaging_material_id)
     db.delete(db_material)
+    publish_change(db, "packaging_materials", material_id)
     db.commit()
     return {"ok": True}
 
@@ -407,14 +544,18 @@ def delete_packaging_material(material_id: int, db: Session = Depends(get_db)):
 def create_product(product: schemas.ProductCreate, db: Session = Depends(get_db)):
     db_product = models.Product(**product.dict())
     db.add(db_product)
+    db.flush()
+    publish_change(db, "products", db_product.product_id)
     db.commit()
     db.refresh(db_product)
     return db_product
 
 @app.get("/products/", response_model=List[schemas.Product])
 def read_products(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    products = db.query(models.Product).offset(skip).limit(limit).all()
-    return products
+    def load():
+        products = db.query(models.Product).offset(skip).limit(limit).all()
+        return [schemas.Product.model_validate(product) for product in products]
+    return coalesced(("products", skip, limit), ["products"], load)
 
 @app.get("/products/{product_id}", response_model=schemas.Product)
 def read_product(product_id: int, db: Session = Depends(get_db)):
@@ -433,6 +574,7 @@ def update_product(product_id: int, product: schemas.ProductUpdate, db: Session
     for field, value in update_data.items():
         setattr(db_product, field, value)
     
+    publish_change(db, "products", db_product.product_id)
     db.commit()
     db.refresh(db_product)
     return db_product
@@ -443,10 +585,110 @@ def delete_product(product_id: int, db: Session = Depends(get_db)):
     if db_product is None:
         raise HTTPException(status_code=404, detail="Product not found")
     
+    record_deletion(db, "products", db_product.product_id)
     db.delete(db_product)
+    publish_change(db, "products", product_id)
     db.commit()
     return {"ok": True}
 
+# Production Plan endpoints
+@app.post("/production-plan", response_model=schemas.ProductionPlan)
+def create_production_plan(plan: schemas.ProductionPlanRequest, db: Session = Depends(get_db)):
+    """
+    Get the total ingredient and packaging requirements and the estimated cost
+    for producing the given number of packages of each product.
+    Purchase quantities are rounded up to whole packs.
+    """
+    packages_by_product = {}
+    for item in plan.items:
+        packages_by_product[item.product_id] = packages_by_product.get(item.product_id, 0) + item.packages
+    
+    try:
+        return costing.explode_production_plan(db, packages_by_product)
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=f"Product {e.args[0]} not found")
+
+# Jobs endpoints
+@app.post("/jobs/{kind}", response_model=schemas.Job)
+def create_job(kind: str, params: Dict[str, Any] = Body(default={}), db: Session = Depends(get_db)):
+    if kind not in JOB_HANDLERS:
+        raise HTTPException(status_code=404, detail="Job kind not found")
+    
+    db_job = models.Job(kind=kind, params=params)
+    db.add(db_job)
+    db.commit()
+    db.refresh(db_job)
+    job_runner.submit(db_job.job_id)
+    return db_job
+
+@app.get("/jobs/{job_id}", response_model=schemas.Job)
+def read_job(job_id: int, db: Session = Depends(get_db)):
+    job = db.query(models.Job).filter(models.Job.job_id == job_id).first()
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@app.post("/jobs/{job_id}/cancel", response_model=schemas.Job)
+def cancel_job(job_id: int, db: Session = Depends(get_db)):
+    # Conditional updates, so a worker claiming the job at the same time either never
+    # sees it pending or sees the cancel request at its next progress update
+    cancelled = db.query(models.Job).filter(
+        models.Job.job_id == job_id, models.Job.status == "pending"
+    ).update({"status": "cancelled", "finished_at": func.now()}, synchronize_session=False)
+    if not cancelled:
+        db.query(models.Job).filter(
+            models.Job.job_id == job_id, models.Job.status == "running"
+        ).update({"cancel_requested": True}, synchronize_session=False)
+    db.commit()
+    
+    db_job = db.query(models.Job).filter(models.Job.job_id == job_id).first()
+    if db_job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return db_job
+
+# Metrics endpoints
+@app.get("/metrics/single-flight")
+def read_single_flight_metrics():
+    return single_flight.stats()
+
+# Sync endpoint
+@app.get("/sync", response_model=schemas.SyncResponse)
+def sync_changes(since: Optional[str] = None, db: Session = Depends(get_db)):
+    """
+    Get rows created, updated or deleted since the given change token.
+    Without a token every row is returned. Pass the returned token as `since`
+    on the next call to receive the changes made in between. Consecutive
+    responses can overlap, so apply upserts and deletions by id.
+    """
+    since_time = None
+    if since:
+        try:
+            since_time = datetime.fromisoformat(since)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid sync token")
+    
+    # Taken before reading so that rows written during the sync are picked up next time
+    token = current_sync_token(db)
+    
+    tables = {}
+    for table_name, (model, schema) in SYNC_TABLES.items():
+        query = db.query(model)
+        if since_time is not None:
+            query = query.filter(changed_since(model.updated_at, since_time))
+        tables[table_name] = schemas.SyncTableChanges(
+            upserted=[schema.model_validate(row).model_dump() for row in query.all()]
+        )
+    
+    if since_time is not None:
+        tombstones = db.query(models.DeletedRecord).filter(
+            changed_since(models.DeletedRecord.deleted_at, since_time)
+        ).order_by(models.DeletedRecord.id).all()
+        for tombstone in tombstones:
+            if tombstone.table_name in tables:
+                tables[tombstone.table_name].deleted.append(tombstone.record_id)
+    
+    return schemas.SyncResponse(token=token.isoformat(), tables=tables)
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
@@ -1,10 +1,13 @@
-from sqlalchemy import Column, Integer, String, DECIMAL, Date, DateTime, ForeignKey, Text, CheckConstraint
+from sqlalchemy import Column, Integer, String, DECIMAL, Date, DateTime, ForeignKey, Text, CheckConstraint, Index, Boolean, JSON
 from sqlalchemy.orm import relationship
-from sqlalchemy.sql import func
+from sqlalchemy.sql import func, text
 from database import Base
 
 class RecipeCategory(Base):
     __tablename__ = "recipe_categories"
+    __table_args__ = (
+        Index("idx_recipe_categories_updated_at", "updated_at"),
+    )
     
     category_id = Column(Integer, primary_key=True, index=True)
     category = Column(String(100), nullable=False)
@@ -16,6 +19,9 @@ class RecipeCategory(Base):
 
 class Ingredient(Base):
     __tablename__ = "ingredients"
+    __table_args__ = (
+        Index("idx_ingredients_updated_at", "updated_at"),
+    )
     
     ingredient_id = Column(Integer, primary_key=True, index=True)
     product_name = Column(String(200), nullable=False)
@@ -31,6 +37,10 @@ class Ingredient(Base):
 
 class PurchaseHistory(Base):
     __tablename__ = "purchase_history"
+    __table_args__ = (
+        Index("idx_purchase_history_ingredient_date", "ingredient_id", "purchase_date"),
+        Index("idx_purchase_history_updated_at", "updated_at"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     purchase_date = Column(Date, nullable=False)
@@ -46,6 +56,9 @@ class PurchaseHistory(Base):
 
 class EggMaster(Base):
     __tablename__ = "egg_master"
+    __table_args__ = (
+        Index("idx_egg_master_updated_at", "updated_at"),
+    )
     
     egg_id = Column(Integer, primary_key=True, index=True)
     whole_egg_weight = Column(DECIMAL(5,2), nullable=False, default=50.00)
@@ -56,6 +69,9 @@ class EggMaster(Base):
 
 class PackagingMaterial(Base):
     __tablename__ = "packaging_materials"
+    __table_args__ = (
+        Index("idx_packaging_materials_updated_at", "updated_at"),
+    )
     
     packaging_material_id = Column(Integer, primary_key=True, index=True)
     product_name = Column(String(200), nullable=False)
@@ -71,6 +87,10 @@ class PackagingMaterial(Base):
 
 class Recipe(Base):
     __tablename__ = "recipes"
+    __table_args__ = (
+        Index("idx_recipes_category_id", "category_id"),
+        Index("idx_recipes_updated_at", "updated_at"),
+    )
     
     recipe_id = Column(Integer, primary_key=True, index=True)
     recipe_name = Column(String(200), nullable=False)
@@ -92,6 +112,11 @@ class Recipe(Base):
 
 class RecipeDetail(Base):
     __tablename__ = "recipe_details"
+    __table_args__ = (
+        Index("idx_recipe_details_recipe_id", "recipe_id"),
+        Index("idx_recipe_details_egg_type", "egg_type"),
+        Index("idx_recipe_details_updated_at", "updated_at"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     recipe_id = Column(Integer, ForeignKey("recipes.recipe_id"))
@@ -108,6 +133,9 @@ class RecipeDetail(Base):
 
 class Product(Base):
     __tablename__ = "products"
+    __table_args__ = (
+        Index("idx_products_updated_at", "updated_at"),
+    )
     
     product_id = Column(Integer, primary_key=True, index=True)
     product_name = Column(String(200), nullable=False)
@@ -125,6 +153,10 @@ class Product(Base):
 
 class PackagingPurchaseHistory(Base):
     __tablename__ = "packaging_purchase_history"
+    __table_args__ = (
+        Index("idx_packaging_purchase_history_material_date", "packaging_material_id", "purchase_date"),
+        Index("idx_packaging_purchase_history_updated_at", "updated_at"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     purchase_date = Column(Date, nullable=False)
@@ -136,4 +168,66 @@ class PackagingPurchaseHistory(Base):
     created_at = Column(DateTime, server_default=func.now())
     updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now())
     
-    packaging_material = relationship("PackagingMaterial", back_populates="packaging_purchase_history")
\ No newline at end of file
+    packaging_material = relationship("PackagingMaterial", back_populates="packaging_purchase_history")
+
+class DeletedRecord(Base):
+    __tablename__ = "deleted_records"
+    __table_args__ = (
+        Index("idx_deleted_records_deleted_at", "deleted_at"),
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    table_name = Column(String(50), nullable=False)
+    record_id = Column(Integer, nullable=False)
+    deleted_at = Column(DateTime, server_default=func.now())
+
+class CacheVersion(Base):
+    __tablename__ = "cache_versions"
+    
+    # Bumped by every write on databases without LISTEN/NOTIFY, polled by the other workers
+    table_name = Column(String(50), primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+
+class RecipeCostSnapshot(Base):
+    __tablename__ = "recipe_cost_snapshots"
+    __table_args__ = (
+        Index("idx_recipe_cost_snapshots_recipe_date", "recipe_id", "snapshot_date"),
+        Index("idx_recipe_cost_snapshots_date", "snapshot_date"),
+        # One recipe row (product_id NULL) and one row per product for each date
+        Index("uq_recipe_cost_snapshots_recipe", "snapshot_date", "recipe_id", unique=True,
+              postgresql_where=text("product_id IS NULL"), sqlite_where=text("product_id IS NULL")),
+        Index("uq_recipe_cost_snapshots_product", "snapshot_date", "product_id", unique=True,
+              postgresql_where=text("product_id IS NOT NULL"), sqlite_where=text("product_id IS NOT NULL")),
+    )
+    
+    # No foreign keys so that history survives deletion of the recipe or product
+    id = Column(Integer, primary_key=True, index=True)
+    snapshot_date = Column(Date, nullable=False)
+    recipe_id = Column(Integer, nullable=False)
+    product_id = Column(Integer, nullable=True)
+    batch_cost = Column(DECIMAL(12,2), nullable=False)
+    unit_cost = Column(DECIMAL(12,4), nullable=False)
+    package_cost = Column(DECIMAL(12,2), nullable=True)
+    created_at = Column(DateTime, server_default=func.now())
+
+class Job(Base):
+    __tablename__ = "jobs"
+    __table_args__ = (
+        Index("idx_jobs_status", "status"),
+    )
+    
+    job_id = Column(Integer, primary_key=True, index=True)
+    kind = Column(String(50), nullable=False)
+    status = Column(String(20), CheckConstraint("status IN ('pending', 'running', 'succeeded', 'failed', 'cancelled')"), default='pending')
+    progress = Column(Integer, nullable=False, default=0)
+    params = Column(JSON)
+    result = Column(JSON)
+    error = Column(Text)
+    cancel_requested = Column(Boolean, nullable=False, default=False)
+    # Worker running the job and its last sign of life, for requeueing jobs of dead workers
+    owner = Column(String(100))
+    heartbeat_at = Column(DateTime)
+    started_at = Column(DateTime)
+    finished_at = Column(DateTime)
+    created_at = Column(DateTime, server_default=func.now())
+    updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now())
\ No newline at end of file
@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field
-from typing import Optional, List
+from typing import Optional, List, Dict, Any
 from datetime import date, datetime
 from decimal import Decimal
 
@@ -201,4 +201,87 @@ class Product(ProductBase):
     updated_at: datetime
     
     class Config:
-        from_attributes = True
\ No newline at end of file
+        from_attributes = True
+
+# Production Plan Schemas
+class ProductionPlanItem(BaseModel):
+    product_id: int
+    packages: int = Field(..., gt=0)
+
+class ProductionPlanRequest(BaseModel):
+    items: List[ProductionPlanItem] = Field(..., min_length=1)
+
+class ProductionPlanProduct(BaseModel):
+    product_id: int
+    product_name: str
+    packages: int
+    pieces: int
+    batches: Decimal
+    estimated_cost: Decimal
+
+class IngredientRequirement(BaseModel):
+    ingredient_id: int
+    recipe_display_name: str
+    required_quantity: Decimal
+    quantity_unit: str
+    purchase_packs: int
+    purchase_quantity: int
+    unit_price: Optional[Decimal] = None
+    estimated_cost: Decimal
+
+class PackagingRequirement(BaseModel):
+    packaging_material_id: int
+    recipe_display_name: str
+    required_quantity: int
+    quantity_unit: str
+    purchase_packs: int
+    purchase_quantity: int
+    unit_price: Optional[Decimal] = None
+    estimated_cost: Decimal
+
+class ProductionPlan(BaseModel):
+    products: List[ProductionPlanProduct]
+    ingredients: List[IngredientRequirement]
+    packaging: List[PackagingRequirement]
+    total_cost: Decimal
+
+# Recipe Cost Snapshot Schemas
+class RecipeCostSnapshot(BaseModel):
+    snapshot_date: date
+    recipe_id: int
+    product_id: Optional[int] = None
+    batch_cost: Decimal
+    unit_cost: Decimal
+    package_cost: Optional[Decimal] = None
+    
+    class Config:
+        from_attributes = True
+
+# Job Schemas
+class Job(BaseModel):
+    job_id: int
+    kind: str
+    status: str
+    progress: int
+    params: Optional[Dict[str, Any]] = None
+    result: Optional[Any] = None
+    error: Optional[str] = None
+    cancel_requested: bool
+    owner: Optional[str] = None
+    heartbeat_at: Optional[datetime] = None
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    created_at: datetime
+    updated_at: datetime
+    
+    class Config:
+        from_attributes = True
+
+# Sync Schemas
+class SyncTableChanges(BaseModel):
+    upserted: List[Dict[str, Any]] = []
+    deleted: List[int] = []
+
+class SyncResponse(BaseModel):
+    token: str
+    tables: Dict[str, SyncTableChanges]
\ No newline at end of file
@@ -0,0 +1,134 @@
+import logging
+import os
+import threading
+from datetime import date, timedelta
+from decimal import Decimal
+
+from sqlalchemy import func, text
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+
+from database import SessionLocal
+import costing
+import models
+
+logger = logging.getLogger(__name__)
+
+# 1 for daily snapshots, 7 for weekly
+SNAPSHOT_INTERVAL_DAYS = int(os.getenv("COST_SNAPSHOT_INTERVAL_DAYS", "1"))
+CHECK_INTERVAL = float(os.getenv("COST_SNAPSHOT_CHECK_INTERVAL", "3600"))
+# Arbitrary key so that only one worker writes snapshots at a time
+SNAPSHOT_LOCK_KEY = 72730030
+
+
+def pending_snapshot_dates(db: Session, today: date):
+    """
+    Snapshot dates that have not been written yet, oldest first. Only completed
+    days are snapshotted, since purchases dated today may still be entered.
+    """
+    last_date = db.query(func.max(models.RecipeCostSnapshot.snapshot_date)).scalar()
+    if last_date is None:
+        return [today - timedelta(days=1)]
+    dates = []
+    next_date = last_date + timedelta(days=SNAPSHOT_INTERVAL_DAYS)
+    while next_date < today:
+        dates.append(next_date)
+        next_date += timedelta(days=SNAPSHOT_INTERVAL_DAYS)
+    return dates
+
+
+def write_snapshots(db: Session, snapshot_dates):
+    """
+    Write recipe and product cost snapshots for each date, skipping rows that
+    already exist. Prices are the latest purchases on or before the date;
+    recipe composition and products are taken as they are now, since their
+    history is not recorded.
+    """
+    recipes = db.query(models.Recipe).all()
+    products = db.query(models.Product).filter(models.Product.recipe_id.isnot(None)).all()
+    details_by_recipe, ingredients = costing.load_recipe_details(db, [recipe.recipe_id for recipe in recipes])
+    egg_master = db.query(models.EggMaster).order_by(models.EggMaster.egg_id).first()
+    materials = {material.packaging_material_id: material for material in db.query(models.PackagingMaterial).all()}
+
+    for snapshot_date in snapshot_dates:
+        ingredient_prices = costing.latest_ingredient_prices(db, list(ingredients), as_of=snapshot_date)
+        packaging_prices = costing.latest_packaging_prices(db, list(materials), as_of=snapshot_date)
+        batch_costs = costing.recipe_batch_costs(details_by_recipe, ingredients, egg_master, ingredient_prices)
+
+        unit_costs = {}
+        rows = []
+        for recipe in recipes:
+            batch_cost = batch_costs.get(recipe.recipe_id, Decimal("0"))
+            unit_costs[recipe.recipe_id] = batch_cost / recipe.yield_per_batch
+            rows.append(dict(
+                snapshot_date=snapshot_date,
+                recipe_id=recipe.recipe_id,
+                product_id=None,
+                batch_cost=batch_cost.quantize(costing.COST_PRECISION),
+                unit_cost=unit_costs[recipe.recipe_id].quantize(Decimal("0.0001")),
+                package_cost=None,
+            ))
+
+        for product in products:
+            if product.recipe_id not in unit_costs:
+                continue
+            package_cost = costing.package_cost(
+                product, unit_costs[product.recipe_id], materials.get(product.packaging_material_id), packaging_prices
+            )
+            rows.append(dict(
+                snapshot_date=snapshot_date,
+                recipe_id=product.recipe_id,
+                product_id=product.product_id,
+                batch_cost=batch_costs.get(product.recipe_id, Decimal("0")).quantize(costing.COST_PRECISION),
+                unit_cost=unit_costs[product.recipe_id].quantize(Decimal("0.0001")),
+                package_cost=package_cost.quantize(costing.COST_PRECISION),
+            ))
+
+        if rows:
+            # Dates another writer already covered are left as they are
+            db.execute(_insert(db, models.RecipeCostSnapshot.__table__).values(rows).on_conflict_do_nothing())
+
+
+def _insert(db: Session, table):
+    if db.get_bind().dialect.name == "postgresql":
+        return postgresql_insert(table)
+    return sqlite_insert(table)
+
+
+def try_lock(db: Session):
+    """Take the snapshot writer lock for the current transaction. Always succeeds outside Postgres."""
+    if db.get_bind().dialect.name != "postgresql":
+        return True
+    return db.execute(text("SELECT pg_try_advisory_xact_lock(:key)"), {"key": SNAPSHOT_LOCK_KEY}).scalar()
+
+
+def catch_up(db: Session, today: date = None):
+    """Write every snapshot missed since the last one. Returns the number of dates written."""
+    if not try_lock(db):
+        return 0
+
+    snapshot_dates = pending_snapshot_dates(db, today or date.today())
+    if snapshot_dates:
+        write_snapshots(db, snapshot_dates)
+    db.commit()
+    return len(snapshot_dates)
+
+
+def _run(stop_event):
+    while not stop_event.is_set():
+        try:
+            with SessionLocal() as db:
+                written = catch_up(db)
+            if written:
+                logger.info("Wrote cost snapshots for %d date(s)", written)
+        except Exception:
+            logger.exception("Cost snapshot job failed")
+        stop_event.wait(CHECK_INTERVAL)
+
+
+def start_snapshot_worker():
+    """Start the background thread that keeps cost snapshots up to date. Returns its stop event."""
+    stop_event = threading.Event()
+    threading.Thread(target=_run, args=(stop_event,), name="cost-snapshots", daemon=True).start()
+    return stop_event
@@ -200,6 +200,33 @@ class ApiService {
   deletePackagingMaterial(id: number) {
     return this.delete(`/packaging-materials/${id}`);
   }
+
+  // Production Plan
+  createProductionPlan(items: { product_id: number; packages: number }[]) {
+    return this.post<any>('/production-plan', { items });
+  }
+
+  // Jobs
+  createJob(kind: string, params: any = {}) {
+    return this.post<any>(`/jobs/${kind}`, params);
+  }
+
+  getJob(id: number) {
+    return this.get<any>(`/jobs/${id}`);
+  }
+
+  cancelJob(id: number) {
+    return this.post<any>(`/jobs/${id}/cancel`, {});
+  }
+
+  // Sync
+  getChangesSince(since?: string) {
+    const query = since ? `?since=${encodeURIComponent(since)}` : '';
+    return this.get<{
+      token: string;
+      tables: {[tableName: string]: { upserted: any[]; deleted: number[] }};
+    }>(`/sync${query}`);
+  }
 }
 
 export const apiService = new ApiService();
\ No newline at end of file